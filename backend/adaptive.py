@@ -0,0 +1,185 @@
+"""Adaptive difficulty from per-student Elo ratings.
+
+Every submission updates the student's rating in O(1): the task level acts as
+the opponent's rating, a correct answer scores 1 when it takes up to half the
+time limit and drops linearly to ``1 - SLOW_PENALTY`` at the limit, and the
+K-factor shrinks as the student accumulates attempts so levels settle instead
+of flapping. The estimate is stored on the student as
+``skill: {"rating": float, "n": int, "start": float}`` and ``current_level`` is
+derived from it. ``start`` is the rating the estimate began from, taken from
+the student's level when the first submission was recorded.
+
+``python adaptive.py replay`` rebuilds every estimate from archived and hot
+task submissions in one streaming pass, starting each student where the live
+updates started.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+import retention
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+LEVEL_RATINGS = {"Beginner": 800, "Intermediate": 1100, "Advanced": 1400, "Master": 1700}
+LEVELS = list(LEVEL_RATINGS)
+
+# Time limits used by the student UI, in seconds
+TIME_LIMITS = {"mcq": 30, "coding": 300}
+SLOW_PENALTY = 0.3
+K_MAX = 64.0
+K_MIN = 16.0
+K_HALF_LIFE = 10
+
+
+def initial_skill(level: Optional[str] = None) -> dict:
+    rating = float(LEVEL_RATINGS.get(level, LEVEL_RATINGS["Beginner"]))
+    return {"rating": rating, "n": 0, "start": rating}
+
+
+def update_skill(skill: dict, level: str, task_type: str, is_correct: bool, time_taken: int) -> dict:
+    rating, n = skill["rating"], skill["n"]
+    difficulty = LEVEL_RATINGS.get(level, LEVEL_RATINGS["Beginner"])
+    expected = 1.0 / (1.0 + math.pow(10.0, (difficulty - rating) / 400.0))
+    if is_correct:
+        limit = TIME_LIMITS.get(task_type, TIME_LIMITS["mcq"])
+        slowness = min(1.0, max(0.0, 2.0 * time_taken / limit - 1.0))
+        score = 1.0 - SLOW_PENALTY * slowness
+    else:
+        score = 0.0
+    k = max(K_MIN, K_MAX / (1.0 + n / K_HALF_LIFE))
+    return {**skill, "rating": round(rating + k * (score - expected), 1), "n": n + 1}
+
+
+def level_for(rating: float) -> str:
+    """The level whose difficulty is nearest to ``rating``."""
+    return min(LEVELS, key=lambda level: abs(LEVEL_RATINGS[level] - rating))
+
+
+def level_mix(rating: float, count: int) -> Dict[str, int]:
+    """Split ``count`` questions between the two levels bracketing ``rating``."""
+    if rating <= LEVEL_RATINGS[LEVELS[0]]:
+        return {LEVELS[0]: count}
+    if rating >= LEVEL_RATINGS[LEVELS[-1]]:
+        return {LEVELS[-1]: count}
+    for lower, upper in zip(LEVELS, LEVELS[1:]):
+        if rating < LEVEL_RATINGS[upper]:
+            share = (rating - LEVEL_RATINGS[lower]) / (LEVEL_RATINGS[upper] - LEVEL_RATINGS[lower])
+            harder = int(share * count)
+            # Hand the fractional question to the harder level with matching odds
+            if random.random() < share * count - harder:
+                harder += 1
+            mix = {lower: count - harder, upper: harder}
+            return {level: n for level, n in mix.items() if n}
+
+
+def pick_level(rating: float) -> str:
+    """One of the levels bracketing ``rating``, with the odds ``level_mix`` uses."""
+    return next(iter(level_mix(rating, 1)))
+
+
+def student_skill(student: dict) -> dict:
+    return student.get("skill") or initial_skill(student.get("current_level"))
+
+
+def starting_skill(student: dict) -> dict:
+    """The estimate ``student``'s history is replayed from, as the live path began it."""
+    skill = student.get("skill")
+    if not skill:
+        return initial_skill(student.get("current_level"))
+    # Estimates from before ``start`` was recorded began from a level that
+    # has since been overwritten; Beginner is the only safe assumption
+    rating = float(skill.get("start", LEVEL_RATINGS["Beginner"]))
+    return {"rating": rating, "n": 0, "start": rating}
+
+
+async def record_submission(db, student_id: str, level: str, task_type: str, is_correct: bool, time_taken: int) -> None:
+    """Fold one submission into the student's estimate and level."""
+    for _ in range(3):
+        student = await db.students.find_one({"id": student_id}, {"_id": 0, "skill": 1, "current_level": 1})
+        if not student:
+            return
+        skill = update_skill(student_skill(student), level, task_type, is_correct, time_taken)
+        # Only apply on top of the estimate we read so concurrent submissions are not lost
+        result = await db.students.update_one(
+            {"id": student_id, "skill": student.get("skill")},
+            {"$set": {"skill": skill, "current_level": level_for(skill["rating"])}}
+        )
+        if result.matched_count:
+            return
+
+
+async def replay(db, batch_size: int = 1000) -> Dict[str, int]:
+    """Recompute every student's estimate from scratch.
+
+    Archived submissions are always older than the hot ones, so reading each
+    student's archives before streaming ``task_submissions`` in timestamp order
+    applies every student's history in order. Students without submissions
+    are reset to their starting estimate.
+    """
+    from pymongo import UpdateOne
+
+    skills: Dict[str, dict] = {}
+    async for student in db.students.find({}, {"_id": 0, "id": 1, "skill": 1, "current_level": 1}):
+        skills[student["id"]] = starting_skill(student)
+    submissions = 0
+
+    def apply(record) -> int:
+        skill = skills.get(record["student_id"])
+        if skill is None:
+            # Left behind by a deleted student
+            return 0
+        skills[record["student_id"]] = update_skill(
+            skill, record["level"], record["task_type"], record["is_correct"], record.get("time_taken", 0)
+        )
+        return 1
+
+    async for archive in db.submission_archives.find(
+        {"status": "complete"}, {"_id": 0}
+    ).sort([("student_id", 1), ("first_timestamp", 1)]):
+        for record in await retention.read_archive(archive):
+            submissions += apply(record)
+
+    async for record in db.task_submissions.find(
+        {}, {"_id": 0, "student_id": 1, "level": 1, "task_type": 1, "is_correct": 1, "time_taken": 1}
+    ).sort("timestamp", 1):
+        submissions += apply(record)
+
+    updates = [
+        UpdateOne({"id": student_id}, {"$set": {"skill": skill, "current_level": level_for(skill["rating"])}})
+        for student_id, skill in skills.items()
+    ]
+    for start in range(0, len(updates), batch_size):
+        await db.students.bulk_write(updates[start:start + batch_size], ordered=False)
+    return {"submissions": submissions, "students": len(skills)}
+
+
+async def _main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Adaptive difficulty tools")
+    parser.add_argument("command", choices=["replay"])
+    parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        print(json.dumps(await replay(client[os.environ['DB_NAME']])))
+    except retention.ArchiveUnavailable as e:
+        # A replay without part of the history would write wrong estimates
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
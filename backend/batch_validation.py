@@ -0,0 +1,93 @@
+"""Micro-batching for coding validation requests.
+
+During a timed round many students submit fixes for the same snippet within
+a few hundred milliseconds of each other. ``MicroBatcher`` holds requests that
+share a key for up to ``window`` seconds (or until ``max_size`` are waiting),
+hands them to ``run_batch`` together and resolves each caller with its own
+result. ``run_batch`` may return an exception in place of a result to fail
+that caller alone. Batching happens inside one worker process.
+
+Submissions from different students share a prompt, so a submission that
+talks to the grader (mentions the reply fields or other submissions, or asks
+to ignore instructions) is graded on its own instead; see
+``addresses_grader``.
+"""
+import asyncio
+import os
+import re
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+BATCH_VALIDATION_WINDOW_MS = float(os.environ.get('BATCH_VALIDATION_WINDOW_MS', '300'))
+BATCH_VALIDATION_MAX_SIZE = int(os.environ.get('BATCH_VALIDATION_MAX_SIZE', '16'))
+
+_GRADER_TEXT = re.compile(
+    r"is_correct|explanation|submission"
+    r"|(?:ignore|disregard|forget)\b.{0,40}\b(?:instructions?|above|previous|prior|rules?)",
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def addresses_grader(code: str) -> bool:
+    """Whether ``code`` contains text aimed at the model grading it.
+
+    Such submissions are kept out of shared batches so they cannot influence
+    the verdicts of other students' code. False positives only cost one
+    unbatched model call.
+    """
+    return bool(_GRADER_TEXT.search(code))
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], Awaitable[List[Any]]], window: float, max_size: int):
+        self._run_batch = run_batch
+        self._window = window
+        self._max_size = max_size
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._running = set()
+        self.counters = Counter()
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self._max_size:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self._window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        task = asyncio.create_task(self._run(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.counters["batches"] += 1
+        self.counters["items"] += len(batch)
+        try:
+            results = await self._run_batch(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # A caller that disconnected has already cancelled its future
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def metrics(self) -> dict:
+        return dict(self.counters)
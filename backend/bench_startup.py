@@ -0,0 +1,60 @@
+"""Measure how long importing the API module takes in a fresh interpreter.
+
+Usage: python bench_startup.py [--runs N] [--budget-ms MS]
+
+Exits non-zero if the median import time exceeds the budget or if importing
+server.py pulls in any of the integrations that are meant to load lazily.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+LAZY_MODULES = ["motor", "pymongo", "passlib", "bcrypt", "emergentintegrations"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = (time.perf_counter() - started) * 1000
+loaded = [m for m in %r if m in sys.modules]
+print(json.dumps({"import_ms": elapsed, "loaded": loaded}))
+""" % (LAZY_MODULES,)
+
+
+def run_once():
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    timings = [r["import_ms"] for r in results]
+    median = statistics.median(timings)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    print(f"server import: median {median:.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms over {args.runs} runs")
+    failed = False
+    if loaded:
+        print(f"eagerly imported: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"median import time exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Near-duplicate detection for generated questions.
+
+Each question is reduced to a set of shingles: its content words, lightly
+stemmed, with stopwords dropped and code tokens such as ``print(2**3)`` kept
+whole. Rewordings ("What is the output of print(2**3)?" / "What does
+print(2**3) output?") keep the same content words, while questions about a
+different expression do not. A MinHash signature of the set is split into
+many short LSH bands, so finding candidates for a new question is a handful
+of dict lookups against an in-process index, and each candidate is then
+checked with the exact Jaccard similarity of the two shingle sets. The index
+is persisted in ``question_fingerprints`` and periodically synced so every
+worker sees questions the others generated.
+
+Questions whose similarity to an indexed one reaches ``SIMILARITY_THRESHOLD``
+are treated as the same question and share its fingerprint id.
+"""
+import hashlib
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Bumped whenever shingling changes; older fingerprints are not comparable
+FINGERPRINT_VERSION = 3
+# 20 bands of 5 rows make a pair with similarity 0.75 a candidate 99.6% of the
+# time (97.5% at 0.7) and one at 0.33 under 8% of the time; candidates are then
+# checked exactly. Short questions share most of their few content words, so
+# fewer rows would flood the buckets.
+NUM_PERM = 100
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SIMILARITY_THRESHOLD = 0.7
+SYNC_INTERVAL = 30.0
+# created_at is stamped before the insert, so a fingerprint can become visible
+# after a newer one; each sync re-reads this many seconds behind its position
+SYNC_OVERLAP = 300.0
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_STOPWORDS = frozenset("""
+    a an the this that these those it its is are was were be been being will would can could
+    should shall may might do does did of in on at to for by with from as and or which what who
+    whom whose how when following after before value result
+""".split())
+_EDGE_PUNCTUATION = ".,;:?!'\"`"
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def _hash(text: str) -> int:
+    # Kept below 2**61 so hashes fit a BSON int64 and the MinHash field
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little") % _PRIME
+
+
+def _stem(token: str) -> str:
+    if _WORD_RE.fullmatch(token):
+        for suffix in ("ing", "ed", "s"):
+            if token.endswith(suffix) and not token.endswith("ss") and len(token) - len(suffix) >= 3:
+                return token[:-len(suffix)]
+    return token
+
+
+def content_tokens(text: str) -> List[str]:
+    tokens = (token.strip(_EDGE_PUNCTUATION) for token in text.lower().split())
+    return [_stem(token) for token in tokens if token and token not in _STOPWORDS]
+
+
+def shingles(text: str) -> Set[int]:
+    return {_hash(token) for token in content_tokens(text)} or {_hash("")}
+
+
+def signature(hashes: Iterable[int]) -> List[int]:
+    hashes = list(hashes)
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(kind: str, sig: List[int]) -> List[str]:
+    return [
+        f"{kind}:{band}:{hashlib.blake2b(repr(sig[band * ROWS:(band + 1) * ROWS]).encode(), digest_size=8).hexdigest()}"
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a: Set[int], b: Set[int]) -> float:
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def question_text(kind: str, item: dict) -> str:
+    if kind == "coding":
+        return item.get("code_snippet", "")
+    # Options are left out: once stopwords are dropped they would outweigh the
+    # question itself, and different questions often share the same options
+    return item.get("question", "")
+
+
+class QuestionIndex:
+    def __init__(self, db):
+        self._db = db
+        self._shingles: Dict[str, Set[int]] = {}
+        self._buckets: Dict[str, List[str]] = {}
+        self._synced_at: Optional[str] = None
+        self._last_sync = 0.0
+
+    def _add(self, fingerprint_id: str, bands: List[str], hashes: Iterable[int]) -> None:
+        self._shingles[fingerprint_id] = set(hashes)
+        for key in bands:
+            self._buckets.setdefault(key, []).append(fingerprint_id)
+
+    def find_duplicate(self, hashes: Set[int], bands: List[str]) -> Optional[str]:
+        candidates = set()
+        for key in bands:
+            candidates.update(self._buckets.get(key, ()))
+        best_id, best = None, SIMILARITY_THRESHOLD
+        # Sets whose sizes differ too much cannot reach the threshold
+        min_size, max_size = len(hashes) * SIMILARITY_THRESHOLD, len(hashes) / SIMILARITY_THRESHOLD
+        for candidate in candidates:
+            other = self._shingles[candidate]
+            if not min_size <= len(other) <= max_size:
+                continue
+            score = similarity(hashes, other)
+            if score >= best:
+                best_id, best = candidate, score
+        return best_id
+
+    async def sync(self, force: bool = False) -> None:
+        """Load fingerprints other workers stored since the last sync."""
+        if not force and time.monotonic() - self._last_sync < SYNC_INTERVAL:
+            return
+        self._last_sync = time.monotonic()
+        query = {"version": FINGERPRINT_VERSION}
+        if self._synced_at:
+            since = datetime.fromisoformat(self._synced_at) - timedelta(seconds=SYNC_OVERLAP)
+            query["created_at"] = {"$gt": since.isoformat()}
+        async for doc in self._db.question_fingerprints.find(query, {"_id": 0}).sort("created_at", 1):
+            if doc["id"] not in self._shingles:
+                self._add(doc["id"], doc["bands"], doc["shingles"])
+            self._synced_at = max(self._synced_at or "", doc["created_at"])
+
+    async def register(self, kind: str, level: str, text: str) -> Tuple[str, bool]:
+        """Return ``(fingerprint_id, is_new)`` for a generated question."""
+        await self.sync()
+        hashes = shingles(text)
+        bands = band_keys(kind, signature(hashes))
+        duplicate = self.find_duplicate(hashes, bands)
+        if duplicate:
+            return duplicate, False
+        fingerprint_id = str(uuid.uuid4())
+        await self._db.question_fingerprints.insert_one({
+            "id": fingerprint_id,
+            "version": FINGERPRINT_VERSION,
+            "kind": kind,
+            "level": level,
+            "shingles": sorted(hashes),
+            "bands": bands,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+        self._add(fingerprint_id, bands, hashes)
+        return fingerprint_id, True
+
+
+# Per-student record of served questions
+async def seen_fingerprints(db, student_id: str) -> Set[str]:
+    docs = await db.student_seen_questions.find(
+        {"student_id": student_id}, {"_id": 0, "fingerprint_id": 1}
+    ).to_list(None)
+    return {doc["fingerprint_id"] for doc in docs}
+
+
+async def mark_seen(db, student_id: str, fingerprint_ids: List[str]) -> None:
+    from pymongo import UpdateOne
+    # A quiz may include near-duplicates that share a fingerprint
+    fingerprint_ids = list(dict.fromkeys(fingerprint_ids))
+    if not fingerprint_ids:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.student_seen_questions.bulk_write([
+        UpdateOne(
+            {"student_id": student_id, "fingerprint_id": fingerprint_id},
+            {"$setOnInsert": {"seen_at": now}},
+            upsert=True
+        )
+        for fingerprint_id in fingerprint_ids
+    ], ordered=False)
+
+
+async def ensure_indexes(db) -> None:
+    await db.question_fingerprints.create_index("id", unique=True)
+    await db.question_fingerprints.create_index([("version", 1), ("created_at", 1)])
+    await db.student_seen_questions.create_index([("student_id", 1), ("fingerprint_id", 1)], unique=True)
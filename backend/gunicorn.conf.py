@@ -0,0 +1,14 @@
+# Multi-worker entry point: gunicorn -c gunicorn.conf.py server:app
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("WORKER_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("WORKER_KEEPALIVE", "5"))
+
+# server.py picks the shared state backend from WEB_CONCURRENCY, so export it
+# for the workers even when the worker count came from the CPU count.
+raw_env = [f"WEB_CONCURRENCY={workers}"]
@@ -0,0 +1,148 @@
+"""Rate limiting and admission control for expensive routes.
+
+Each route class has two token buckets: one per caller identity (student id,
+admin username or register number) and a larger one per client IP, since a
+whole classroom may share one address. Both keys come from the request, so an
+identity only gets its own bucket once it resolves to an existing student or
+admin, and the IP is the socket peer unless ``RATE_LIMIT_TRUSTED_PROXIES``
+says how many proxies in front of the app append to ``X-Forwarded-For``.
+Buckets live in the shared state backend so limits hold across workers.
+
+LLM routes are additionally shed with a fast 429 while this worker has too
+many upstream model calls in flight, or while upstream latency is high and
+calls are queuing up.
+
+Budgets are ``burst/per_minute`` pairs and can be overridden with
+``RATE_LIMIT_<CLASS>_<SCOPE>``, e.g. ``RATE_LIMIT_LLM_IDENTITY=5/10``.
+"""
+import math
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+DEFAULT_BUDGETS = {
+    "llm": {"identity": "5/10", "ip": "60/120"},
+    "auth": {"identity": "10/20", "ip": "60/120"},
+}
+
+LLM_MAX_INFLIGHT = int(os.environ.get('LLM_MAX_INFLIGHT', '32'))
+LLM_SHED_LATENCY_MS = float(os.environ.get('LLM_SHED_LATENCY_MS', '30000'))
+LATENCY_EWMA_ALPHA = 0.2
+TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '0'))
+
+
+def _parse_budget(value: str) -> Tuple[float, float]:
+    burst, per_minute = value.split("/")
+    return float(burst), float(per_minute) / 60.0
+
+
+def load_budgets() -> Dict[str, Dict[str, Tuple[float, float]]]:
+    return {
+        route_class: {
+            scope: _parse_budget(os.environ.get(f"RATE_LIMIT_{route_class.upper()}_{scope.upper()}", default))
+            for scope, default in scopes.items()
+        }
+        for route_class, scopes in DEFAULT_BUDGETS.items()
+    }
+
+
+def client_ip(request: Request, trusted_proxies: int = TRUSTED_PROXIES) -> str:
+    """The address of the client as seen by the outermost trusted proxy.
+
+    Clients can write anything into ``X-Forwarded-For``; each proxy appends the
+    address it received the request from, so only the entries added by our own
+    proxies, counted from the right, can be trusted.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if trusted_proxies <= 0:
+        return peer
+    forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",") if entry.strip()]
+    if len(forwarded) < trusted_proxies:
+        return peer
+    return forwarded[-trusted_proxies]
+
+
+class RateLimiter:
+    def __init__(self, state):
+        self._state = state
+        self.budgets = load_budgets()
+        self.counters = Counter()
+        self.inflight = 0
+        self.latency_ewma_ms = 0.0
+
+    def _too_busy(self) -> bool:
+        if self.inflight >= LLM_MAX_INFLIGHT:
+            return True
+        # High latency only sheds once calls are actually piling up, so the
+        # estimate keeps getting refreshed while load is light
+        return self.latency_ewma_ms > LLM_SHED_LATENCY_MS and self.inflight >= LLM_MAX_INFLIGHT // 4
+
+    def _reject(self, route_class: str, reason: str, retry_after: float):
+        self.counters[f"{route_class}.{reason}"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def check(self, route_class: str, identity, ip: str) -> None:
+        if route_class == "llm" and self._too_busy():
+            self._reject(route_class, "shed", min(30.0, max(1.0, self.latency_ewma_ms / 1000)))
+
+        for scope, key in (("identity", identity), ("ip", ip)):
+            if not key:
+                continue
+            capacity, refill = self.budgets[route_class][scope]
+            missing = await self._state.take_token(f"rate:{route_class}:{scope}:{key}", capacity, refill)
+            if missing:
+                self._reject(route_class, f"limited.{scope}", missing / refill)
+        self.counters[f"{route_class}.allowed"] += 1
+
+    def guard(
+        self,
+        route_class: str,
+        identity_field: Optional[str] = None,
+        resolve_identity: Optional[Callable[[str], Awaitable[bool]]] = None
+    ):
+        """FastAPI dependency enforcing ``route_class`` limits on a JSON route.
+
+        ``identity_field`` in the body is only used as a bucket key when
+        ``resolve_identity`` confirms it names a real account; otherwise the
+        request is limited by IP alone.
+        """
+        async def dependency(request: Request):
+            identity = None
+            if identity_field:
+                try:
+                    body = await request.json()
+                except ValueError:
+                    body = {}
+                value = body.get(identity_field) if isinstance(body, dict) else None
+                if isinstance(value, str) and value and resolve_identity and await resolve_identity(value):
+                    identity = value
+            await self.check(route_class, identity, client_ip(request))
+        return dependency
+
+    @asynccontextmanager
+    async def upstream_call(self):
+        """Track in-flight model calls and their latency for load shedding."""
+        self.inflight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.latency_ewma_ms += LATENCY_EWMA_ALPHA * (elapsed_ms - self.latency_ewma_ms)
+            self.counters["llm.upstream_calls"] += 1
+
+    def metrics(self) -> dict:
+        return {
+            "counters": dict(self.counters),
+            "llm_inflight": self.inflight,
+            "llm_latency_ewma_ms": round(self.latency_ewma_ms, 1),
+        }
@@ -0,0 +1,342 @@
+"""Tiered retention for ``task_submissions``.
+
+Submissions older than the retention age are moved out of the hot collection:
+
+- their counts are folded into one ``submission_rollups`` document per student,
+  so completion percentages and analytics stay exact;
+- the full records are written to zstd-compressed NDJSON files under
+  ``ARCHIVE_DIR/<student_id>/<archive_id>.ndjson.zst``, indexed by
+  ``submission_archives``, so a student's full history can be rehydrated.
+  ``ARCHIVE_DIR`` must be storage every API host and retention run share;
+  an archive that is missing raises ``ArchiveUnavailable``.
+
+Run from the command line with ``python retention.py --older-than-days 180``
+or through ``POST /api/admin/retention/run``. Either way a run holds a lease in
+``retention_lease`` and renews it as it goes, so two runs never archive the
+same records.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', '180'))
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', ROOT_DIR / 'archive'))
+MAX_ARCHIVE_RECORDS = 5000
+LEASE_TTL = 300
+
+# Rollup breakdowns use these values as field names; anything else a client
+# sent is counted under OTHER_BUCKET so it cannot pick arbitrary field paths
+ROLLUP_TASK_TYPES = frozenset({"mcq", "coding"})
+ROLLUP_LEVELS = frozenset({"Beginner", "Intermediate", "Advanced", "Master"})
+OTHER_BUCKET = "other"
+
+
+class RetentionInProgress(Exception):
+    pass
+
+
+class ArchiveUnavailable(Exception):
+    pass
+
+
+# Exact statistics across hot and rolled-up submissions
+async def submission_stats(db, student_ids: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Return ``{student_id: (total, correct)}`` for the given students."""
+    stats = {student_id: (0, 0) for student_id in student_ids}
+    hot = await db.task_submissions.aggregate([
+        {"$match": {"student_id": {"$in": student_ids}}},
+        {"$group": {
+            "_id": "$student_id",
+            "total": {"$sum": 1},
+            "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}}
+        }}
+    ]).to_list(None)
+    for row in hot:
+        stats[row["_id"]] = (row["total"], row["correct"])
+    async for rollup in db.submission_rollups.find({"student_id": {"$in": student_ids}}, {"_id": 0}):
+        total, correct = stats[rollup["student_id"]]
+        stats[rollup["student_id"]] = (total + rollup["total"], correct + rollup["correct"])
+    return stats
+
+
+async def overall_stats(db) -> Dict[str, int]:
+    """Totals over every submission ever made, archived or not."""
+    hot = await db.task_submissions.aggregate([
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}}
+        }}
+    ]).to_list(1)
+    rolled = await db.submission_rollups.aggregate([
+        {"$group": {"_id": None, "total": {"$sum": "$total"}, "correct": {"$sum": "$correct"}}}
+    ]).to_list(1)
+    active = set(await db.task_submissions.distinct("student_id"))
+    active.update(await db.submission_rollups.distinct("student_id", {"total": {"$gt": 0}}))
+    return {
+        "total": sum(row["total"] for row in hot + rolled),
+        "correct": sum(row["correct"] for row in hot + rolled),
+        "active_students": len(active)
+    }
+
+
+# Archive files
+def _write_archive(path: Path, records: List[dict]) -> None:
+    import zstandard
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = "".join(json.dumps(record) + "\n" for record in records).encode()
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(zstandard.ZstdCompressor(level=10).compress(payload))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_archive(path: Path) -> List[dict]:
+    import zstandard
+    with open(path, "rb") as f:
+        payload = zstandard.ZstdDecompressor().stream_reader(f).read()
+    return [json.loads(line) for line in payload.decode().splitlines() if line]
+
+
+def archive_path(archive: dict) -> Path:
+    # Paths are stored relative to ARCHIVE_DIR; older archives stored absolute ones
+    return ARCHIVE_DIR / archive["path"]
+
+
+async def read_archive(archive: dict) -> List[dict]:
+    path = archive_path(archive)
+    try:
+        return await asyncio.to_thread(_read_archive, path)
+    except FileNotFoundError:
+        raise ArchiveUnavailable(
+            f"Archive {archive['id']} of student {archive['student_id']} is missing at {path}; "
+            "ARCHIVE_DIR must be shared by every host"
+        )
+
+
+async def load_archived_submissions(db, student_id: str) -> List[dict]:
+    """Rehydrate every archived submission of one student, oldest first."""
+    records = []
+    async for archive in db.submission_archives.find(
+        {"student_id": student_id, "status": "complete"}, {"_id": 0}
+    ).sort("first_timestamp", 1):
+        records.extend(await read_archive(archive))
+    return records
+
+
+async def delete_student_archives(db, student_id: str) -> None:
+    await db.submission_rollups.delete_many({"student_id": student_id})
+    await db.submission_archives.delete_many({"student_id": student_id})
+    await asyncio.to_thread(shutil.rmtree, ARCHIVE_DIR / student_id, True)
+
+
+# Archiving
+def _bucket(value, known: frozenset) -> str:
+    return value if value in known else OTHER_BUCKET
+
+
+def _rollup_increment(records: List[dict]) -> dict:
+    inc = {"total": 0, "correct": 0, "time_taken": 0}
+    for record in records:
+        correct = 1 if record["is_correct"] else 0
+        inc["total"] += 1
+        inc["correct"] += correct
+        inc["time_taken"] += record.get("time_taken", 0)
+        task_type = _bucket(record.get("task_type"), ROLLUP_TASK_TYPES)
+        level = _bucket(record.get("level"), ROLLUP_LEVELS)
+        for field in (f"by_task_type.{task_type}", f"by_level.{level}"):
+            inc[f"{field}.total"] = inc.get(f"{field}.total", 0) + 1
+            inc[f"{field}.correct"] = inc.get(f"{field}.correct", 0) + correct
+    return inc
+
+
+async def _apply_archive(db, archive: dict, records: List[dict]) -> None:
+    """Fold an archive into the rollup and drop its records from the hot collection.
+
+    Both steps are idempotent, so a pending archive left behind by an
+    interrupted run can simply be applied again.
+    """
+    from pymongo.errors import DuplicateKeyError
+    try:
+        await db.submission_rollups.update_one(
+            {"student_id": archive["student_id"], "archive_ids": {"$ne": archive["id"]}},
+            {
+                "$inc": _rollup_increment(records),
+                "$min": {"first_timestamp": archive["first_timestamp"]},
+                "$max": {"last_timestamp": archive["last_timestamp"]},
+                "$push": {"archive_ids": archive["id"]}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The rollup already includes this archive
+        pass
+    await db.task_submissions.delete_many({"id": {"$in": [record["id"] for record in records]}})
+    await db.submission_archives.update_one({"id": archive["id"]}, {"$set": {"status": "complete"}})
+
+
+async def _archive_student_batch(db, student_id: str, records: List[dict]) -> None:
+    archive_id = str(uuid.uuid4())
+    path = Path(student_id) / f"{archive_id}.ndjson.zst"
+    await asyncio.to_thread(_write_archive, ARCHIVE_DIR / path, records)
+    archive = {
+        "id": archive_id,
+        "student_id": student_id,
+        "path": path.as_posix(),
+        "count": len(records),
+        "first_timestamp": records[0]["timestamp"],
+        "last_timestamp": records[-1]["timestamp"],
+        "status": "pending",
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await db.submission_archives.insert_one(archive)
+    await _apply_archive(db, archive, records)
+
+
+async def ensure_indexes(db) -> None:
+    await db.task_submissions.create_index([("student_id", 1), ("timestamp", 1)])
+    await db.task_submissions.create_index("timestamp")
+    await db.submission_rollups.create_index("student_id", unique=True)
+    await db.submission_archives.create_index([("student_id", 1), ("first_timestamp", 1)])
+    await db.submission_archives.create_index("status")
+
+
+class _Lease:
+    """Exclusive, expiring claim on running retention, renewed while in use."""
+
+    def __init__(self, db):
+        self._db = db
+        self._token = str(uuid.uuid4())
+        self._renewed_at = 0.0
+
+    def _expiry(self):
+        return datetime.now(timezone.utc) + timedelta(seconds=LEASE_TTL)
+
+    async def acquire(self) -> None:
+        from pymongo.errors import DuplicateKeyError
+        try:
+            # Takes over a missing or expired lease; a live one makes the upsert collide
+            await self._db.retention_lease.update_one(
+                {"_id": "retention", "expires_at": {"$lte": datetime.now(timezone.utc)}},
+                {"$set": {"owner": self._token, "expires_at": self._expiry()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            raise RetentionInProgress("Retention run already in progress")
+        self._renewed_at = time.monotonic()
+
+    async def keep_alive(self) -> None:
+        """Renew the lease; call before every write so a lost lease stops the run."""
+        if time.monotonic() - self._renewed_at < LEASE_TTL / 3:
+            return
+        result = await self._db.retention_lease.update_one(
+            {"_id": "retention", "owner": self._token},
+            {"$set": {"expires_at": self._expiry()}}
+        )
+        if not result.matched_count:
+            raise RetentionInProgress("Retention lease was lost to another run")
+        self._renewed_at = time.monotonic()
+
+    async def release(self) -> None:
+        await self._db.retention_lease.delete_one({"_id": "retention", "owner": self._token})
+
+
+async def archive_old_submissions(db, older_than_days: Optional[int] = None) -> Dict[str, int]:
+    """Archive every submission older than ``older_than_days`` in one streaming pass.
+
+    Raises ``RetentionInProgress`` if another run holds the lease.
+    """
+    lease = _Lease(db)
+    await lease.acquire()
+    try:
+        return await _archive_old_submissions(db, lease, older_than_days)
+    finally:
+        await lease.release()
+
+
+async def _archive_old_submissions(db, lease: _Lease, older_than_days: Optional[int]) -> Dict[str, int]:
+    days = RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+    # Finish archives an interrupted run left half-applied. One whose file
+    # cannot be read stays pending, and its student is left alone this run so
+    # the same records are not rolled up twice.
+    recovered = 0
+    blocked = set()
+    async for archive in db.submission_archives.find({"status": "pending"}, {"_id": 0}):
+        await lease.keep_alive()
+        try:
+            records = await read_archive(archive)
+        except ArchiveUnavailable as e:
+            logger.error("Skipping pending archive: %s", e)
+            blocked.add(archive["student_id"])
+            continue
+        await _apply_archive(db, archive, records)
+        recovered += 1
+
+    archived = 0
+    archives = 0
+    student_id = None
+    records = []
+    cursor = db.task_submissions.find(
+        {"timestamp": {"$lt": cutoff}}, {"_id": 0}
+    ).sort([("student_id", 1), ("timestamp", 1)])
+    async for record in cursor:
+        if record["student_id"] in blocked:
+            continue
+        if records and (record["student_id"] != student_id or len(records) >= MAX_ARCHIVE_RECORDS):
+            await lease.keep_alive()
+            await _archive_student_batch(db, student_id, records)
+            archived += len(records)
+            archives += 1
+            records = []
+        student_id = record["student_id"]
+        records.append(record)
+    if records:
+        await lease.keep_alive()
+        await _archive_student_batch(db, student_id, records)
+        archived += len(records)
+        archives += 1
+
+    return {"archived": archived, "archives": archives, "recovered": recovered, "unavailable": len(blocked)}
+
+
+async def _main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Archive old task submissions")
+    parser.add_argument("--older-than-days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        db = client[os.environ['DB_NAME']]
+        await ensure_indexes(db)
+        print(json.dumps(await archive_old_submissions(db, args.older_than_days)))
+    except RetentionInProgress as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,243 @@
+"""Pluggable backend for state shared between API worker processes.
+
+``memory`` keeps everything inside the current process and is only correct
+when a single worker serves the app. ``mongo`` stores state in the
+``shared_state`` collection so every worker sees the same caches, counters
+and locks.
+"""
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional
+
+
+class StateBackend:
+    """Interface implemented by every shared state backend."""
+
+    async def setup(self) -> None:
+        pass
+
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        raise NotImplementedError
+
+    async def push(self, key: str, values: List[Any], max_len: Optional[int] = None) -> int:
+        """Append ``values`` to the list at ``key``, keeping the newest ``max_len``."""
+        raise NotImplementedError
+
+    async def get_list(self, key: str) -> List[Any]:
+        raise NotImplementedError
+
+    async def take_token(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """Take one token from the bucket at ``key``.
+
+        Returns 0 if a token was taken, otherwise the tokens that are still
+        missing (below 1) so the caller can work out when to retry.
+        """
+        raise NotImplementedError
+
+    async def acquire_lock(self, name: str, ttl: float) -> Optional[str]:
+        """Return an owner token if the lock was taken, ``None`` if it is held."""
+        raise NotImplementedError
+
+    async def release_lock(self, name: str, token: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryStateBackend(StateBackend):
+    def __init__(self):
+        self._data = {}
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires_at)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def incr(self, key, amount=1, ttl=None):
+        entry = self._live(key)
+        if entry:
+            value, expires_at = entry[0] + amount, entry[1]
+        else:
+            value, expires_at = amount, (time.monotonic() + ttl if ttl else None)
+        self._data[key] = (value, expires_at)
+        return value
+
+    async def push(self, key, values, max_len=None):
+        entry = self._live(key)
+        items = list(entry[0]) if entry else []
+        items.extend(values)
+        if max_len is not None:
+            items = items[-max_len:]
+        self._data[key] = (items, None)
+        return len(items)
+
+    async def get_list(self, key):
+        entry = self._live(key)
+        return list(entry[0]) if entry else []
+
+    async def take_token(self, key, capacity, refill_per_second):
+        now = time.time()
+        entry = self._live(key)
+        tokens, updated_at = entry[0] if entry else (capacity, now)
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        missing = 0.0 if tokens >= 1 else 1 - tokens
+        if not missing:
+            tokens -= 1
+        # A bucket that would be full again carries no information
+        await self.set(key, (tokens, now), ttl=(capacity - tokens) / refill_per_second + 1)
+        return missing
+
+    async def acquire_lock(self, name, ttl):
+        key = f"lock:{name}"
+        if self._live(key):
+            return None
+        token = str(uuid.uuid4())
+        await self.set(key, token, ttl)
+        return token
+
+    async def release_lock(self, name, token):
+        key = f"lock:{name}"
+        entry = self._live(key)
+        if entry and entry[0] == token:
+            del self._data[key]
+
+
+class MongoStateBackend(StateBackend):
+    """Stores each key as one document; a TTL index reaps expired entries."""
+
+    def __init__(self, db):
+        # Resolved per call so constructing the backend does not open a connection
+        self._db = db
+
+    @property
+    def _col(self):
+        return self._db.shared_state
+
+    @staticmethod
+    def _expiry(ttl):
+        return datetime.now(timezone.utc) + timedelta(seconds=ttl) if ttl else None
+
+    @staticmethod
+    def _not_expired():
+        return {"$or": [{"expires_at": None}, {"expires_at": {"$gt": datetime.now(timezone.utc)}}]}
+
+    async def _purge_expired(self, key):
+        # The TTL monitor only runs once a minute, so expired documents can linger
+        await self._col.delete_one({"_id": key, "expires_at": {"$lte": datetime.now(timezone.utc)}})
+
+    async def setup(self):
+        await self._col.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key):
+        doc = await self._col.find_one({"_id": key, **self._not_expired()})
+        return doc["value"] if doc else None
+
+    async def set(self, key, value, ttl=None):
+        await self._col.replace_one(
+            {"_id": key},
+            {"value": value, "expires_at": self._expiry(ttl)},
+            upsert=True
+        )
+
+    async def delete(self, key):
+        await self._col.delete_one({"_id": key})
+
+    async def incr(self, key, amount=1, ttl=None):
+        from pymongo import ReturnDocument
+        await self._purge_expired(key)
+        doc = await self._col.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expiry(ttl)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["value"]
+
+    async def push(self, key, values, max_len=None):
+        from pymongo import ReturnDocument
+        each = {"$each": list(values)}
+        if max_len is not None:
+            each["$slice"] = -max_len
+        doc = await self._col.find_one_and_update(
+            {"_id": key},
+            {"$push": {"value": each}, "$setOnInsert": {"expires_at": None}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return len(doc["value"])
+
+    async def get_list(self, key):
+        doc = await self._col.find_one({"_id": key, **self._not_expired()})
+        return list(doc["value"]) if doc else []
+
+    async def take_token(self, key, capacity, refill_per_second):
+        from pymongo import ReturnDocument
+        now = time.time()
+        refilled = {"$min": [
+            capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, refill_per_second]}
+            ]}
+        ]}
+        # Refill and take atomically in a single pipeline update
+        doc = await self._col.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": now}},
+                {"$set": {"taken": {"$gte": ["$tokens", 1]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$taken", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                    "expires_at": self._expiry(capacity / refill_per_second + 1)
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0.0 if doc["taken"] else 1 - doc["tokens"]
+
+    async def acquire_lock(self, name, ttl):
+        from pymongo.errors import DuplicateKeyError
+        key = f"lock:{name}"
+        token = str(uuid.uuid4())
+        await self._purge_expired(key)
+        try:
+            await self._col.insert_one({"_id": key, "value": token, "expires_at": self._expiry(ttl)})
+        except DuplicateKeyError:
+            return None
+        return token
+
+    async def release_lock(self, name, token):
+        await self._col.delete_one({"_id": f"lock:{name}", "value": token})
+
+
+def create_state_backend(kind: str, db) -> StateBackend:
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "mongo":
+        return MongoStateBackend(db)
+    raise ValueError(f"Unknown STATE_BACKEND: {kind!r} (expected 'memory' or 'mongo')")
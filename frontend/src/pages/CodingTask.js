@@ -13,10 +13,12 @@ const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
 const TASK_DURATION = 300; // 5 minutes in seconds
+// The backend picks a level from the student's skill estimate when none is sent
+const ADAPTIVE_LEVEL = "adaptive";
 
 export default function CodingTask({ student }) {
   const navigate = useNavigate();
-  const [level, setLevel] = useState(student.current_level);
+  const [level, setLevel] = useState(ADAPTIVE_LEVEL);
   const [task, setTask] = useState(null);
   const [code, setCode] = useState("");
   const [timeLeft, setTimeLeft] = useState(TASK_DURATION);
@@ -76,7 +78,10 @@ export default function CodingTask({ student }) {
   const startTask = async () => {
     setLoading(true);
     try {
-      const response = await axios.post(`${API}/tasks/coding/generate`, { level });
+      const response = await axios.post(`${API}/tasks/coding/generate`, {
+        level: level === ADAPTIVE_LEVEL ? undefined : level,
+        student_id: student.id
+      });
       setTask(response.data);
       setCode("");
       setTimeLeft(TASK_DURATION);
@@ -97,7 +102,7 @@ export default function CodingTask({ student }) {
     await axios.post(`${API}/tasks/submit`, {
       student_id: student.id,
       task_type: "coding",
-      level,
+      level: task?.level,
       question: task?.code_snippet || "",
       submitted_answer: code,
       is_correct: false,
@@ -124,16 +129,17 @@ export default function CodingTask({ student }) {
 
     try {
       const validation = await axios.post(`${API}/tasks/coding/validate`, {
-        level,
+        level: task.level,
         original_code: task.code_snippet,
-        submitted_code: code
+        submitted_code: code,
+        student_id: student.id
       });
 
       // Submit task
       await axios.post(`${API}/tasks/submit`, {
         student_id: student.id,
         task_type: "coding",
-        level,
+        level: task.level,
         question: task.code_snippet,
         submitted_answer: code,
         is_correct: validation.data.is_correct,
@@ -200,6 +206,7 @@ export default function CodingTask({ student }) {
                     <SelectValue />
                   </SelectTrigger>
                   <SelectContent>
+                    <SelectItem value={ADAPTIVE_LEVEL}>Adaptive (recommended)</SelectItem>
                     <SelectItem value="Beginner">Beginner</SelectItem>
                     <SelectItem value="Intermediate">Intermediate</SelectItem>
                     <SelectItem value="Advanced">Advanced</SelectItem>
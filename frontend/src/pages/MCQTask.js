@@ -16,10 +16,12 @@ const API = `${BACKEND_URL}/api`;
 
 const QUESTION_DURATION = 30; // 30 seconds per question
 const QUESTIONS_PER_LEVEL = 10;
+// The backend picks levels from the student's skill estimate when none is sent
+const ADAPTIVE_LEVEL = "adaptive";
 
 export default function MCQTask({ student }) {
   const navigate = useNavigate();
-  const [level, setLevel] = useState(student.current_level);
+  const [level, setLevel] = useState(ADAPTIVE_LEVEL);
   const [questions, setQuestions] = useState([]);
   const [currentQuestionIndex, setCurrentQuestionIndex] = useState(0);
   const [selectedAnswer, setSelectedAnswer] = useState("");
@@ -53,7 +55,10 @@ export default function MCQTask({ student }) {
   const startQuiz = async () => {
     setLoading(true);
     try {
-      const response = await axios.post(`${API}/tasks/mcq/generate`, { level });
+      const response = await axios.post(`${API}/tasks/mcq/generate`, {
+        level: level === ADAPTIVE_LEVEL ? undefined : level,
+        student_id: student.id
+      });
       setQuestions(response.data.questions);
       setCurrentQuestionIndex(0);
       setSelectedAnswer("");
@@ -88,7 +93,7 @@ export default function MCQTask({ student }) {
     await axios.post(`${API}/tasks/submit`, {
       student_id: student.id,
       task_type: "mcq",
-      level,
+      level: currentQuestion.level || level,
       question: currentQuestion.question,
       submitted_answer: selectedAnswer,
       is_correct: isCorrect,
@@ -159,6 +164,7 @@ export default function MCQTask({ student }) {
                     <SelectValue />
                   </SelectTrigger>
                   <SelectContent>
+                    <SelectItem value={ADAPTIVE_LEVEL}>Adaptive (recommended)</SelectItem>
                     <SelectItem value="Beginner">Beginner</SelectItem>
                     <SelectItem value="Intermediate">Intermediate</SelectItem>
                     <SelectItem value="Advanced">Advanced</SelectItem>
@@ -237,7 +243,7 @@ export default function MCQTask({ student }) {
             <CardHeader className="space-y-4">
               <div className="flex items-center justify-between">
                 <Badge variant="outline">Question {currentQuestionIndex + 1}/{questions.length}</Badge>
-                <Badge className="bg-primary">{level}</Badge>
+                <Badge className="bg-primary">{questions[currentQuestionIndex]?.level || level}</Badge>
               </div>
               <Progress value={progress} className="h-2" />
             </CardHeader>
@@ -0,0 +1,141 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import adaptive
+from adaptive import LEVEL_RATINGS, initial_skill, level_for, level_mix, update_skill
+
+
+def test_even_match_moves_rating_by_half_the_k_factor():
+    skill = initial_skill("Intermediate")
+    assert update_skill(skill, "Intermediate", "mcq", True, 5) == {
+        "rating": 1100 + adaptive.K_MAX / 2, "n": 1, "start": 1100
+    }
+    assert update_skill(skill, "Intermediate", "mcq", False, 5) == {
+        "rating": 1100 - adaptive.K_MAX / 2, "n": 1, "start": 1100
+    }
+
+
+def test_slow_correct_answers_gain_less():
+    skill = initial_skill("Beginner")
+    limit = adaptive.TIME_LIMITS["coding"]
+    fast = update_skill(skill, "Beginner", "coding", True, limit // 2)
+    slow = update_skill(skill, "Beginner", "coding", True, limit)
+    over = update_skill(skill, "Beginner", "coding", True, limit * 3)
+    assert fast["rating"] == 800 + adaptive.K_MAX / 2
+    assert slow["rating"] == pytest.approx(800 + adaptive.K_MAX * (0.5 - adaptive.SLOW_PENALTY), abs=0.1)
+    assert over == slow
+
+
+def test_k_factor_decays_with_attempts():
+    gains = [
+        update_skill({"rating": 1100.0, "n": n}, "Intermediate", "mcq", True, 0)["rating"] - 1100
+        for n in (0, adaptive.K_HALF_LIFE, 1000)
+    ]
+    assert gains == [adaptive.K_MAX / 2, adaptive.K_MAX / 4, adaptive.K_MIN / 2]
+
+
+def test_harder_level_is_worth_more():
+    skill = initial_skill("Beginner")
+    easy = update_skill(skill, "Beginner", "mcq", True, 0)["rating"]
+    hard = update_skill(skill, "Advanced", "mcq", True, 0)["rating"]
+    assert hard > easy
+
+
+def test_unknown_level_counts_as_beginner():
+    skill = initial_skill("Intermediate")
+    assert update_skill(skill, "Expert", "mcq", True, 0) == update_skill(skill, "Beginner", "mcq", True, 0)
+
+
+@pytest.mark.parametrize("rating, level", [
+    (500, "Beginner"), (949, "Beginner"), (951, "Intermediate"), (1400, "Advanced"), (2500, "Master"),
+])
+def test_level_for_picks_nearest_level(rating, level):
+    assert level_for(rating) == level
+
+
+@pytest.mark.parametrize("rating, mix", [
+    (600, {"Beginner": 10}),
+    (LEVEL_RATINGS["Beginner"], {"Beginner": 10}),
+    (950, {"Beginner": 5, "Intermediate": 5}),
+    (LEVEL_RATINGS["Intermediate"], {"Intermediate": 10}),
+    (1640, {"Advanced": 2, "Master": 8}),
+    (2000, {"Master": 10}),
+])
+def test_level_mix_splits_between_neighbouring_levels(rating, mix):
+    assert level_mix(rating, 10) == mix
+
+
+def test_level_mix_rounds_fraction_towards_harder_level_with_matching_odds(monkeypatch):
+    # 875 is a quarter of the way from Beginner to Intermediate: 2.5 of 10 questions
+    monkeypatch.setattr(adaptive.random, "random", lambda: 0.49)
+    assert level_mix(875, 10) == {"Beginner": 7, "Intermediate": 3}
+    monkeypatch.setattr(adaptive.random, "random", lambda: 0.51)
+    assert level_mix(875, 10) == {"Beginner": 8, "Intermediate": 2}
+
+
+@pytest.mark.parametrize("rating", [812.5, 1033.3, 1250, 1555.5])
+@pytest.mark.parametrize("count", [1, 3, 10])
+def test_level_mix_always_serves_count_questions(rating, count):
+    assert sum(level_mix(rating, count).values()) == count
+
+
+def test_pick_level_follows_level_mix_odds(monkeypatch):
+    monkeypatch.setattr(adaptive.random, "random", lambda: 0.2)
+    assert adaptive.pick_level(875) == "Intermediate"
+    monkeypatch.setattr(adaptive.random, "random", lambda: 0.3)
+    assert adaptive.pick_level(875) == "Beginner"
+    assert adaptive.pick_level(2000) == "Master"
+
+
+# Replay against an in-memory Mongo
+@pytest.fixture
+def db(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["adaptive_test"]
+
+    async def bulk_write(collection, requests, ordered=True):
+        # mongomock cannot apply pymongo's UpdateOne since pymongo 4.9
+        for request in requests:
+            await collection.update_one(request._filter, request._doc)
+
+    monkeypatch.setattr(type(db.students), "bulk_write", bulk_write)
+    return db
+
+
+def test_replay_matches_live_updates_and_resets_idle_students(db):
+    history = [("legacy", "Advanced", True, 10), ("fresh", "Beginner", True, 5),
+               ("legacy", "Master", False, 20), ("fresh", "Intermediate", True, 25)]
+    started = datetime.now(timezone.utc)
+
+    async def scenario():
+        await db.students.insert_many([
+            # Students from before skill estimates only carry a level
+            {"id": "legacy", "current_level": "Advanced"},
+            {"id": "fresh", "current_level": "Beginner"},
+            {"id": "idle", "current_level": "Intermediate"},
+        ])
+        for offset, (student_id, level, is_correct, time_taken) in enumerate(history):
+            await adaptive.record_submission(db, student_id, level, "mcq", is_correct, time_taken)
+            await db.task_submissions.insert_one({
+                "id": str(uuid.uuid4()), "student_id": student_id, "task_type": "mcq", "level": level,
+                "is_correct": is_correct, "time_taken": time_taken,
+                "timestamp": (started + timedelta(seconds=offset)).isoformat(),
+            })
+        live = {doc["id"]: doc async for doc in db.students.find({}, {"_id": 0})}
+        # An estimate that no longer matches any history is reset by the replay
+        await db.students.update_one({"id": "idle"}, {"$set": {"skill": {"rating": 1650.0, "n": 9, "start": 1100.0}}})
+        result = await adaptive.replay(db)
+        replayed = {doc["id"]: doc async for doc in db.students.find({}, {"_id": 0})}
+        return live, result, replayed
+
+    live, result, replayed = asyncio.run(scenario())
+    assert result == {"submissions": 4, "students": 3}
+    assert live["legacy"]["skill"]["start"] == LEVEL_RATINGS["Advanced"]
+    for student_id in ("legacy", "fresh"):
+        assert replayed[student_id]["skill"] == live[student_id]["skill"]
+        assert replayed[student_id]["current_level"] == live[student_id]["current_level"]
+    assert replayed["idle"]["skill"] == {"rating": 1100.0, "n": 0, "start": 1100.0}
+    assert replayed["idle"]["current_level"] == "Intermediate"
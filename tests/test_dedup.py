@@ -0,0 +1,184 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import dedup
+from dedup import QuestionIndex, SIMILARITY_THRESHOLD, band_keys, shingles, signature, similarity
+
+REWORDED = [
+    ("What is the output of print(2**3)?", "What does print(2**3) output?"),
+    ("Which keyword is used to define a function in Python?", "In Python, which keyword defines a function?"),
+    ("What is the result of len([1, 2, 3])?", "What does len([1, 2, 3]) return?"),
+    ("What will be printed by print(type(3.0))?", "What does print(type(3.0)) print?"),
+    ("Which data type is immutable in Python: list, dict, set or tuple?",
+     "In Python, which of list, dict, set and tuple is immutable?"),
+    ("What is the value of x after x = 5; x += 2?", "After x = 5; x += 2, what is the value of x?"),
+]
+
+DISTINCT = [
+    ("What is the output of print(2**3)?", "What is the output of print(3**2)?"),
+    ("What is the output of print(2**3)?", "What is the output of print(10 // 3)?"),
+    ("Which keyword is used to define a function in Python?", "Which keyword is used to define a class in Python?"),
+    ("What is the result of len([1, 2, 3])?", "What is the result of sum([1, 2, 3])?"),
+    ("What is the value of x after x = 5; x += 2?", "What is the value of y after y = [1]; y.append(2)?"),
+]
+
+
+def fingerprint(text, kind="mcq"):
+    hashes = shingles(text)
+    return hashes, band_keys(kind, signature(hashes))
+
+
+def add(index, fingerprint_id, text, kind="mcq"):
+    hashes, bands = fingerprint(text, kind)
+    index._add(fingerprint_id, bands, hashes)
+
+
+@pytest.mark.parametrize("original, reworded", REWORDED)
+def test_rewordings_reach_threshold(original, reworded):
+    assert similarity(shingles(original), shingles(reworded)) >= SIMILARITY_THRESHOLD
+
+
+@pytest.mark.parametrize("first, second", DISTINCT)
+def test_different_questions_stay_below_threshold(first, second):
+    assert similarity(shingles(first), shingles(second)) < SIMILARITY_THRESHOLD
+
+
+def test_identical_text_shares_every_band():
+    _, bands = fingerprint("What does print(2**3) output?")
+    assert bands == fingerprint("what does PRINT(2**3) output")[1]
+    assert len(bands) == dedup.BANDS
+
+
+@pytest.mark.parametrize("original, reworded", REWORDED)
+def test_index_finds_rewording(original, reworded):
+    index = QuestionIndex(db=None)
+    add(index, "original", original)
+    for other, _ in DISTINCT:
+        if other != original:
+            add(index, other, other)
+    assert index.find_duplicate(*fingerprint(reworded)) == "original"
+
+
+def test_index_ignores_other_question_kinds():
+    index = QuestionIndex(db=None)
+    add(index, "mcq", "print(2**3)", kind="mcq")
+    assert index.find_duplicate(*fingerprint("print(2**3)", kind="coding")) is None
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, *args):
+        return self
+
+    async def __aiter__(self):
+        for doc in self._docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    def find(self, query, projection=None):
+        since = query.get("created_at", {}).get("$gt", "")
+        docs = [doc for doc in self.docs if doc["version"] == query["version"] and doc["created_at"] > since]
+        return FakeCursor(sorted(docs, key=lambda doc: doc["created_at"]))
+
+
+class FakeDB:
+    def __init__(self):
+        self.question_fingerprints = FakeCollection()
+
+
+def test_register_reuses_fingerprint_across_workers():
+    db = FakeDB()
+    first_worker, second_worker = QuestionIndex(db), QuestionIndex(db)
+
+    async def scenario():
+        original = await first_worker.register("mcq", "Beginner", "What is the output of print(2**3)?")
+        reworded = await second_worker.register("mcq", "Beginner", "What does print(2**3) output?")
+        different = await second_worker.register("mcq", "Beginner", "What is the output of print(3**2)?")
+        return original, reworded, different
+
+    (original_id, is_new), reworded, different = asyncio.run(scenario())
+    assert is_new
+    assert reworded == (original_id, False)
+    assert different[1] and different[0] != original_id
+    assert len(db.question_fingerprints.docs) == 2
+
+
+def mcq(question, options=("6", "8", "9", "5")):
+    return {"question": question, "options": list(options), "correct_answer": "B", "explanation": ""}
+
+
+def test_shared_options_do_not_merge_different_questions():
+    first = dedup.question_text("mcq", mcq("What is the output of print(2**3)?"))
+    second = dedup.question_text("mcq", mcq("What is the output of print(3**2)?"))
+    assert similarity(shingles(first), shingles(second)) < SIMILARITY_THRESHOLD
+
+    function = mcq("Which keyword is used to define a function in Python?", ("A) def", "B) class", "C) fun", "D) lambda"))
+    klass = mcq("Which keyword is used to define a class in Python?", ("A) def", "B) class", "C) fun", "D) lambda"))
+    assert similarity(
+        shingles(dedup.question_text("mcq", function)), shingles(dedup.question_text("mcq", klass))
+    ) < SIMILARITY_THRESHOLD
+
+
+def test_generated_quiz_is_served_in_full(monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "question_index", QuestionIndex(FakeDB()))
+    monkeypatch.setattr(server, "QUESTION_BANK_SIZE", 0)
+    batch = [mcq(f"What is the output of print({a}**{b})?") for a, b in [(2, 3), (3, 2), (2, 4), (4, 2), (5, 2)]]
+    # Rewordings in the same batch are served last, once nothing better is left
+    batch += [mcq("What does print(2**3) output?"), mcq("What does print(3**2) output?")]
+
+    async def generate():
+        return [dict(item) for item in batch]
+
+    async def scenario(count):
+        return await server.generate_unseen("mcq", "Beginner", count, generate, seen=set(), unseen_bank=[])
+
+    served = asyncio.run(scenario(len(batch)))
+    assert len(served) == len(batch)
+    assert [item["question"] for item in served] == [item["question"] for item in batch]
+    assert len({item["fingerprint_id"] for item in served}) == 5
+
+    monkeypatch.setattr(server, "question_index", QuestionIndex(FakeDB()))
+    assert len({item["fingerprint_id"] for item in asyncio.run(scenario(5))}) == 5
+
+
+def test_each_candidate_is_scored_once(monkeypatch):
+    index = QuestionIndex(db=None)
+    add(index, "original", "What is the output of print(2**3)?")
+    calls = []
+    monkeypatch.setattr(dedup, "similarity", lambda a, b: calls.append(1) or similarity(a, b))
+    # An identical question collides with the original in every band
+    assert index.find_duplicate(*fingerprint("What is the output of print(2**3)?")) == "original"
+    assert len(calls) == 1
+
+
+def test_sync_picks_up_fingerprints_that_become_visible_late():
+    db = FakeDB()
+    writer, reader = QuestionIndex(db), QuestionIndex(db)
+
+    async def scenario():
+        # Stamped first, but its insert lands after a newer fingerprint was synced
+        early, _ = fingerprint("What is the output of print(2**3)?")
+        await writer.register("mcq", "Beginner", "What is the value of x after x = 5; x += 2?")
+        await reader.sync(force=True)
+        late = dict(db.question_fingerprints.docs[0], id="late", shingles=sorted(early),
+                    bands=band_keys("mcq", signature(early)))
+        stamped = datetime.fromisoformat(db.question_fingerprints.docs[0]["created_at"]) - timedelta(seconds=1)
+        late["created_at"] = stamped.isoformat()
+        db.question_fingerprints.docs.append(late)
+        await reader.sync(force=True)
+        return await reader.register("mcq", "Beginner", "What does print(2**3) output?")
+
+    assert asyncio.run(scenario()) == ("late", False)
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import rate_limit
+import shared_state
+from shared_state import MemoryStateBackend
+
+
+def make_request(peer="10.0.0.1", forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(shared_state.time, "time", lambda: now[0])
+    limiter = rate_limit.RateLimiter(MemoryStateBackend())
+    # 2 requests of burst, refilled at 6 per minute (one every 10 seconds)
+    limiter.budgets = {"llm": {"identity": (2, 0.1), "ip": (100, 10.0)}}
+    limiter.clock = now
+    return limiter
+
+
+def check(limiter, identity="student-1", ip="10.0.0.1"):
+    asyncio.run(limiter.check("llm", identity, ip))
+
+
+def test_client_ip_ignores_forwarded_for_by_default():
+    assert rate_limit.client_ip(make_request(forwarded="1.2.3.4"), trusted_proxies=0) == "10.0.0.1"
+
+
+def test_client_ip_counts_trusted_proxies_from_the_right():
+    request = make_request(forwarded="6.6.6.6, 1.2.3.4, 172.16.0.2")
+    assert rate_limit.client_ip(request, trusted_proxies=1) == "172.16.0.2"
+    assert rate_limit.client_ip(request, trusted_proxies=2) == "1.2.3.4"
+
+
+def test_client_ip_falls_back_to_peer_when_header_is_short():
+    assert rate_limit.client_ip(make_request(forwarded="1.2.3.4"), trusted_proxies=2) == "10.0.0.1"
+
+
+def test_rejects_with_retry_after_once_burst_is_spent(limiter):
+    check(limiter)
+    check(limiter)
+    with pytest.raises(HTTPException) as exc:
+        check(limiter)
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "10"
+    assert limiter.counters["llm.limited.identity"] == 1
+
+
+def test_retry_after_shrinks_as_the_bucket_refills(limiter):
+    check(limiter)
+    check(limiter)
+    limiter.clock[0] += 7.5
+    with pytest.raises(HTTPException) as exc:
+        check(limiter)
+    assert exc.value.headers["Retry-After"] == "3"
+    limiter.clock[0] += 2.5
+    check(limiter)
+
+
+def test_ip_bucket_applies_without_identity(limiter):
+    limiter.budgets["llm"]["ip"] = (1, 0.1)
+    check(limiter, identity=None)
+    with pytest.raises(HTTPException) as exc:
+        check(limiter, identity=None)
+    assert exc.value.headers["Retry-After"] == "10"
+
+
+def test_unknown_identity_is_not_used_as_a_key(limiter):
+    async def resolve(student_id):
+        return student_id == "real"
+
+    dependency = limiter.guard("llm", "student_id", resolve)
+    limiter.budgets["llm"]["ip"] = (3, 0.1)
+
+    async def call(student_id):
+        request = make_request()
+        request._json = {"student_id": student_id}
+        await dependency(request)
+
+    # Made-up ids all land in the shared IP bucket
+    for student_id in ("fake-1", "fake-2", "fake-3"):
+        asyncio.run(call(student_id))
+    with pytest.raises(HTTPException):
+        asyncio.run(call("fake-4"))
+    assert limiter.counters["llm.limited.ip"] == 1
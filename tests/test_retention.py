@@ -0,0 +1,149 @@
+import asyncio
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+import retention
+from retention import OTHER_BUCKET, _rollup_increment
+
+
+def record(level="Beginner", task_type="mcq", is_correct=True, time_taken=10):
+    return {"level": level, "task_type": task_type, "is_correct": is_correct, "time_taken": time_taken}
+
+
+def test_rollup_increment_counts_totals_and_breakdowns():
+    inc = _rollup_increment([
+        record(),
+        record(level="Advanced", task_type="coding", is_correct=False, time_taken=120),
+        record(),
+    ])
+    assert inc == {
+        "total": 3, "correct": 2, "time_taken": 140,
+        "by_task_type.mcq.total": 2, "by_task_type.mcq.correct": 2,
+        "by_task_type.coding.total": 1, "by_task_type.coding.correct": 0,
+        "by_level.Beginner.total": 2, "by_level.Beginner.correct": 2,
+        "by_level.Advanced.total": 1, "by_level.Advanced.correct": 0,
+    }
+
+
+def test_unknown_values_cannot_choose_field_paths():
+    inc = _rollup_increment([
+        record(level="total"),
+        record(level="x.y", task_type="$where"),
+        record(level=None, task_type=""),
+    ])
+    assert inc["total"] == 3
+    assert set(inc) == {
+        "total", "correct", "time_taken",
+        "by_task_type.mcq.total", "by_task_type.mcq.correct",
+        f"by_task_type.{OTHER_BUCKET}.total", f"by_task_type.{OTHER_BUCKET}.correct",
+        f"by_level.{OTHER_BUCKET}.total", f"by_level.{OTHER_BUCKET}.correct",
+    }
+    assert inc[f"by_level.{OTHER_BUCKET}.total"] == 3
+
+
+# Archive round trips, against an in-memory Mongo
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+
+@pytest.fixture
+def db():
+    return mongomock_motor.AsyncMongoMockClient()["retention_test"]
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", tmp_path)
+    return tmp_path
+
+
+def submission(student_id, days_ago, is_correct=True, level="Beginner"):
+    timestamp = (datetime.now(timezone.utc) - timedelta(days=days_ago)).isoformat()
+    return {
+        "id": str(uuid.uuid4()), "student_id": student_id, "task_type": "mcq", "level": level,
+        "question": "q", "submitted_answer": "a", "is_correct": is_correct, "time_taken": 5,
+        "timestamp": timestamp,
+    }
+
+
+async def seed(db):
+    await retention.ensure_indexes(db)
+    old = [submission("s1", 400 - day, is_correct=day % 2 == 0) for day in range(5)] + [submission("s2", 300)]
+    recent = [submission("s1", 1), submission("s2", 2, is_correct=False)]
+    await db.task_submissions.insert_many([dict(record) for record in old + recent])
+    return old, recent
+
+
+def hot_ids(db):
+    return asyncio.run(db.task_submissions.distinct("id"))
+
+
+def test_archive_keeps_stats_exact_and_rehydrates_history(db):
+    async def scenario():
+        old, recent = await seed(db)
+        before = await retention.submission_stats(db, ["s1", "s2"])
+        overall_before = await retention.overall_stats(db)
+        result = await retention.archive_old_submissions(db, older_than_days=30)
+        return old, recent, before, overall_before, result
+
+    old, recent, before, overall_before, result = asyncio.run(scenario())
+    assert result == {"archived": 6, "archives": 2, "recovered": 0, "unavailable": 0}
+    assert sorted(hot_ids(db)) == sorted(record["id"] for record in recent)
+    assert asyncio.run(retention.submission_stats(db, ["s1", "s2"])) == before == {"s1": (6, 4), "s2": (2, 1)}
+    assert asyncio.run(retention.overall_stats(db)) == overall_before
+
+    rehydrated = asyncio.run(retention.load_archived_submissions(db, "s1"))
+    assert rehydrated == [record for record in old if record["student_id"] == "s1"]
+    archive = asyncio.run(db.submission_archives.find_one({"student_id": "s1"}))
+    assert not Path(archive["path"]).is_absolute()
+
+
+def test_reapplying_pending_archive_is_idempotent(db):
+    async def scenario():
+        old, _ = await seed(db)
+        await retention.archive_old_submissions(db, older_than_days=30)
+        rollup = await db.submission_rollups.find_one({"student_id": "s1"}, {"_id": 0})
+        # Simulate a run interrupted after the rollup but before the cleanup
+        await db.submission_archives.update_many({}, {"$set": {"status": "pending"}})
+        await db.task_submissions.insert_many([dict(record) for record in old])
+        result = await retention.archive_old_submissions(db, older_than_days=30)
+        return rollup, result, await db.submission_rollups.find_one({"student_id": "s1"}, {"_id": 0})
+
+    rollup, result, reapplied = asyncio.run(scenario())
+    assert result == {"archived": 0, "archives": 0, "recovered": 2, "unavailable": 0}
+    assert reapplied == rollup
+    assert asyncio.run(db.submission_archives.count_documents({"status": "complete"})) == 2
+    assert len(hot_ids(db)) == 2
+
+
+def test_missing_pending_archive_is_skipped_without_blocking_others(db, archive_dir):
+    async def scenario():
+        await seed(db)
+        await retention.archive_old_submissions(db, older_than_days=30)
+        await db.submission_archives.update_one({"student_id": "s1"}, {"$set": {"status": "pending"}})
+        shutil.rmtree(archive_dir / "s1")
+        await db.task_submissions.insert_many([submission("s1", 200), submission("s2", 200)])
+        return await retention.archive_old_submissions(db, older_than_days=30)
+
+    assert asyncio.run(scenario()) == {"archived": 1, "archives": 1, "recovered": 0, "unavailable": 1}
+    # The blocked student's old submission stays hot until its archive is restored
+    assert asyncio.run(db.task_submissions.count_documents({"student_id": "s1"})) == 2
+
+
+def test_history_route_reports_missing_archives(db, archive_dir, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import server
+
+    monkeypatch.setattr(server, "db", db)
+    asyncio.run(seed(db))
+    asyncio.run(retention.archive_old_submissions(db, older_than_days=30))
+    shutil.rmtree(archive_dir / "s1")
+
+    client = TestClient(server.app)
+    assert client.get("/api/tasks/student/s2?include_archived=true").status_code == 200
+    response = client.get("/api/tasks/student/s1?include_archived=true")
+    assert response.status_code == 503
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import shared_state
+from shared_state import MemoryStateBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(shared_state.time, "time", lambda: now[0])
+    return now
+
+
+def take(backend, key="bucket", capacity=3, refill=1.0):
+    return asyncio.run(backend.take_token(key, capacity, refill))
+
+
+def test_take_token_allows_burst_then_reports_missing(clock):
+    backend = MemoryStateBackend()
+    assert [take(backend) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert take(backend) == pytest.approx(1.0)
+
+
+def test_take_token_refills_over_time(clock):
+    backend = MemoryStateBackend()
+    for _ in range(3):
+        take(backend)
+    clock[0] += 0.25
+    assert take(backend) == pytest.approx(0.75)
+    clock[0] += 1.0
+    assert take(backend) == 0.0
+
+
+def test_take_token_never_refills_past_capacity(clock):
+    backend = MemoryStateBackend()
+    take(backend)
+    clock[0] += 3600
+    assert [take(backend) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert take(backend) > 0
+
+
+def test_take_token_buckets_are_independent(clock):
+    backend = MemoryStateBackend()
+    for _ in range(3):
+        take(backend, key="a")
+    assert take(backend, key="a") > 0
+    assert take(backend, key="b") == 0.0
+
+
+def test_lock_is_exclusive_until_released():
+    backend = MemoryStateBackend()
+    token = asyncio.run(backend.acquire_lock("job", ttl=60))
+    assert token
+    assert asyncio.run(backend.acquire_lock("job", ttl=60)) is None
+    asyncio.run(backend.release_lock("job", "someone-else"))
+    assert asyncio.run(backend.acquire_lock("job", ttl=60)) is None
+    asyncio.run(backend.release_lock("job", token))
+    assert asyncio.run(backend.acquire_lock("job", ttl=60))